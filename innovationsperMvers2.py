@@ -10,16 +10,44 @@ Chart is stacked-by-year:
 - typography + palette styled to echo the OECD logo
 """
 
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import gzip
 import json
 
+try:  # optional: C-level JSON serializer, much faster than stdlib json
+    import orjson
+except ImportError:
+    orjson = None
+
 # 👉 Set your paths here
 input_file = Path("countriespatentsfiltered.csv")
 output_file = Path("patents_per_million.csv")
+# Also write the per-row ratios to output_file (only needed by external consumers)
+WRITE_INTERMEDIATE_CSV = False
 
-# 1) Load the OECD CSV
-df = pd.read_csv(input_file)
+# 1) Load the OECD CSV — only the columns we use, with explicit dtypes:
+#    - COUNTRY: few distinct codes, categorical codes make grouping keys cheap ints
+#    - TIME_PERIOD: kept as text; bad years are coerced and dropped in step 5
+#    Uses PyArrow's multithreaded parser when it is installed.
+input_dtypes = {"COUNTRY": "category", "Country": "string",
+                "TIME_PERIOD": "string", "OBS_VALUE": "float64"}
+try:
+    import pyarrow  # noqa: F401
+    csv_engine = "pyarrow"
+except ImportError:
+    csv_engine = "c"
+if csv_engine == "pyarrow":
+    # The pyarrow engine rejects a callable usecols, so list the columns up front
+    header = pd.read_csv(input_file, nrows=0).columns
+    usecols = [c for c in header if c in input_dtypes]
+else:
+    usecols = lambda c: c in input_dtypes  # noqa: E731
+df = pd.read_csv(input_file, engine=csv_engine,
+                 usecols=usecols,  # "Country" may be absent
+                 dtype=input_dtypes)
 
 # 2) Population lookup (millions) — replace with official data if needed
 population_millions = {
@@ -27,41 +55,53 @@ population_millions = {
     "FRA": 68.0, "GBR": 68.0, "JPN": 125.0, "KOR": 52.0,
     "NLD": 18.0, "USA": 333.0, "WXOECD": 1350.0
 }
-pop_df = pd.DataFrame(list(population_millions.items()),
-                      columns=["COUNTRY", "Population_millions"])
+population_series = pd.Series(population_millions, dtype="float64")
 
-# 3) Merge and compute ratio (guard against missing pop and zeros)
-merged = df.merge(pop_df, on="COUNTRY", how="left")
-merged = merged.dropna(subset=["Population_millions"])
-merged = merged[merged["Population_millions"] > 0]
-merged["Patents_per_million"] = merged["OBS_VALUE"] / merged["Population_millions"]
+# 3) Look up populations and compute ratio (guard against missing pop and zeros)
+#    A hashed Series.map replaces the join; division runs on raw arrays
+pop = df["COUNTRY"].map(population_series).to_numpy(dtype="float64")
+keep = pop > 0  # NaN (country without a population) compares False too
+merged = df.loc[keep].copy()
+merged["Population_millions"] = pop[keep]
+merged["Patents_per_million"] = (merged["OBS_VALUE"].to_numpy()
+                                 / merged["Population_millions"].to_numpy())
 
-# 4) Save output CSV (for reference / reuse)
-cols_out = ["COUNTRY", "Country", "TIME_PERIOD",
-            "OBS_VALUE", "Population_millions", "Patents_per_million"]
-merged.to_csv(output_file, index=False,
-              columns=[c for c in cols_out if c in merged.columns])
-print(f"Saved: {output_file.resolve()}")
+# 4) Optionally save output CSV (for reference / reuse) in the background so
+#    the chart-data preparation below overlaps with the disk write
+if WRITE_INTERMEDIATE_CSV:
+    cols_out = ["COUNTRY", "Country", "TIME_PERIOD",
+                "OBS_VALUE", "Population_millions", "Patents_per_million"]
+    csv_writer = ThreadPoolExecutor(max_workers=1)
+    csv_saved = csv_writer.submit(merged.to_csv, output_file, index=False,
+                                  columns=[c for c in cols_out if c in merged.columns],
+                                  chunksize=50_000)
 
 # 5) Prepare chart data for stacked columns (dynamic years)
-df_ratio = pd.read_csv(output_file)
+#    Reuse the in-memory frame instead of re-parsing the CSV we just wrote
+df_ratio = merged[["COUNTRY", "TIME_PERIOD", "Patents_per_million"]].copy()
 
-# Ensure TIME_PERIOD is numeric year
+# Ensure TIME_PERIOD is numeric year (int16: small integer keys for the pivot)
 df_ratio["TIME_PERIOD"] = pd.to_numeric(df_ratio["TIME_PERIOD"], errors="coerce")
 df_ratio = df_ratio.dropna(subset=["TIME_PERIOD", "Patents_per_million"])
-df_ratio["TIME_PERIOD"] = df_ratio["TIME_PERIOD"].astype(int)
-
-# Collapse duplicates per (COUNTRY, TIME_PERIOD)
-df_ratio = (df_ratio
-            .groupby(["COUNTRY", "TIME_PERIOD"], as_index=False)["Patents_per_million"]
-            .mean())
+df_ratio["TIME_PERIOD"] = df_ratio["TIME_PERIOD"].astype("int16")
+# The ratio is computed in float64; only the chart copy is downcast to float32
+# to halve the bytes moved through the mean and the pivot. Values near a
+# half-cent boundary can round 0.01 differently in the chart because of this.
+df_ratio["Patents_per_million"] = df_ratio["Patents_per_million"].astype("float32")
 
-# Pivot to countries × years
-pivot = df_ratio.pivot(index="COUNTRY", columns="TIME_PERIOD", values="Patents_per_million")
-pivot = pivot.sort_index()
+# Collapse duplicates per (COUNTRY, TIME_PERIOD) and pivot to countries × years
+# in a single aggregation. Group keys are left unsorted (years are ordered via
+# years_arr below); only the small result's country index is sorted.
+pivot = df_ratio.pivot_table(
+    index="COUNTRY", columns="TIME_PERIOD",
+    values="Patents_per_million", aggfunc="mean",
+    observed=True, sort=False,
+).sort_index()
 
-# Dynamic years present (sorted)
-years = sorted(pivot.columns.tolist())
+# Dynamic years present (sorted): an int array for lookups/reindexing,
+# a plain list for the JSON payload
+years_arr = np.sort(pivot.columns.to_numpy())
+years = years_arr.tolist()
 
 # ---- Sorting mode for bar order ----
 # "total"  -> sort by total stack height (best for stacked view)
@@ -69,37 +109,49 @@ years = sorted(pivot.columns.tolist())
 # "year:YYYY" -> sort by a specific year present in the data
 SORT_MODE = "total"
 
+# Work on one dense countries × years matrix (years ascending) for every mode;
+# orders are a stable argsort on the raw scores (NaN sorts last)
+mat = pivot.reindex(columns=years_arr).to_numpy(dtype="float32")
+idx = pivot.index.to_numpy()
+scores = None  # None -> keep alphabetical country order
 if SORT_MODE == "total":
-    categories = (pivot.sum(axis=1, skipna=True)
-                        .sort_values(ascending=False)
-                        .index.tolist())
+    scores = np.nansum(mat, axis=1)
 elif SORT_MODE.startswith("year:"):
     try:
         y = int(SORT_MODE.split(":", 1)[1])
     except Exception:
-        y = max(years) if years else None
-    if (y is None) or (y not in pivot.columns):
-        y = max(years) if years else None
-    categories = pivot.index.tolist() if y is None else pivot[y].sort_values(ascending=False).index.tolist()
-else:  # "latest"
-    pivot_chrono = pivot.sort_index(axis=1)  # ensure year ascending
-    latest_vals = pivot_chrono.apply(
-        lambda row: row.dropna().iloc[-1] if not row.dropna().empty else float("nan"),
-        axis=1
-    )
-    categories = latest_vals.sort_values(ascending=False).index.tolist()
+        y = None
+    year_cols = np.flatnonzero(years_arr == y) if y is not None else []
+    if len(year_cols):
+        scores = mat[:, year_cols[0]]
+    elif years:
+        scores = mat[:, -1]  # unknown year -> latest year in the data
+elif years:  # "latest"
+    # Column of the last non-NaN value per row (an all-NaN row lands on a NaN cell)
+    col_idx = mat.shape[1] - 1 - np.argmax(~np.isnan(mat)[:, ::-1], axis=1)
+    scores = mat[np.arange(mat.shape[0]), col_idx]
+order = np.arange(len(idx)) if scores is None else np.argsort(-scores, kind="stable")
+categories = idx[order].tolist()
 
 # Build JS-ready data dict: { "2019":[...], "2020":[...], ... } aligned to categories
-def series_for_year(y: int):
-    s = pivot.reindex(categories)[y] if y in pivot.columns else pd.Series(index=categories, dtype=float)
-    return [None if pd.isna(v) else round(float(v), 2) for v in s.to_list()]
+# Rows of the same matrix in category order; float64 so rounded values print cleanly
+values = np.round(mat[order].astype("float64"), 2)
+cells = values.astype(object)      # object so NaN -> None works
+cells[np.isnan(values)] = None
+data_by_year = {str(y): cells[:, i].tolist() for i, y in enumerate(years)}
 
-data_by_year = {str(y): series_for_year(y) for y in years}
+# Wait for the background CSV write before moving on
+if WRITE_INTERMEDIATE_CSV:
+    csv_saved.result()
+    csv_writer.shutdown()
+    print(f"Saved: {output_file.resolve()}")
 
 # 6) Build the HTML with Highcharts (stacked by year) + exporting
-#    NOTE: This is a plain triple-quoted string (NOT an f-string).
-#    We replace the placeholders __CATEGORIES__, __YEARS__, __DATA_BY_YEAR__ after.
-html_template = """
+#    NOTE: These are plain triple-quoted strings (NOT f-strings).
+#    The static page is split around the embedded data: HTML_PREFIX ends with
+#    "const payload = ", HTML_SUFFIX picks up right after the JSON. Both are
+#    encoded once, so the JSON is written between them without any templating.
+HTML_PREFIX = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -157,9 +209,11 @@ html_template = """
 
   <script>
     // Embedded data from Python (dynamic, no hard-coded years)
-    const categories = __CATEGORIES__;
-    const years = __YEARS__;                 // e.g., [2019, 2020, 2021, 2022]
-    const dataByYear = __DATA_BY_YEAR__;     // { "2019":[...], "2020":[...], ... }
+    const payload = """.encode("utf-8")
+HTML_SUFFIX = """;
+    const categories = payload.categories;
+    const years = payload.years;             // e.g., [2019, 2020, 2021, 2022]
+    const dataByYear = payload.dataByYear;   // { "2019":[...], "2020":[...], ... }
 
     // OECD-like palette from the logo (blues & greens + grey for overflow)
     const brandPalette = [
@@ -247,17 +301,22 @@ html_template = """
   </script>
 </body>
 </html>
-"""
+""".encode("utf-8")
+
+def to_json(obj) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode("utf-8")
 
-# Inject the JSON safely (no f-string) by replacing placeholders
-html_filled = (
-    html_template
-    .replace("__CATEGORIES__", json.dumps(categories))
-    .replace("__YEARS__", json.dumps(years))
-    .replace("__DATA_BY_YEAR__", json.dumps(data_by_year))
-)
+payload = to_json({"categories": categories, "years": years, "dataByYear": data_by_year})
 
-# 7) Save the HTML file
+# 7) Save the HTML file: static prefix, data payload, static suffix, already
+#    UTF-8 encoded and streamed through a 64 KiB write buffer. A pre-gzipped
+#    copy is written alongside so a web server can serve it without
+#    compressing on every request.
 html_path = Path("patents_per_million_chart.html")
-html_path.write_text(html_filled, encoding="utf-8")
-print(f"✅ Chart saved to: {html_path.resolve()}")
+gz_path = html_path.with_name(html_path.name + ".gz")
+with html_path.open("wb", buffering=1 << 16) as f, \
+        gzip.open(gz_path, "wb", compresslevel=6) as gz:
+    for part in (HTML_PREFIX, payload, HTML_SUFFIX):
+        f.write(part)
+        gz.write(part)
+print(f"✅ Chart saved to: {html_path.resolve()} (+ {gz_path.name})")